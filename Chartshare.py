@@ -24,16 +24,280 @@ rendering chartshare XML documents.
 
 """
 
-import sys, re, StringIO
+import sys, os, re, math, array, hashlib, json, zlib, bz2, StringIO
+import csv, glob, time, signal, datetime, multiprocessing
+from optparse import OptionParser
 
 from rpy import *
 from xml.sax.handler import ContentHandler
 from xml.sax.saxutils import XMLGenerator
 from xml.sax import make_parser
 
-class Util:
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+try:
+	import pandas
+except ImportError:
+	pandas = None
+
+try:
+	import pyarrow
+except ImportError:
+	pyarrow = None
+
+def _gzip_decompressor():
+	return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+def _gzip_compressor():
+	return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+def _xz_decompressor():
+	return lzma.LZMADecompressor()
+
+def _xz_compressor():
+	return lzma.LZMACompressor()
+
+def _zstd_decompressor():
+	return zstandard.ZstdDecompressor().decompressobj()
+
+def _zstd_compressor():
+	return zstandard.ZstdCompressor().compressobj()
+
+### name: (magic bytes, file extensions, decompressor, compressor)
+COMPRESSIONS = {
+	'gzip': ('\x1f\x8b', ('.gz',), _gzip_decompressor, _gzip_compressor),
+	'bz2': ('BZh', ('.bz2',), bz2.BZ2Decompressor, bz2.BZ2Compressor),
+	'xz': ('\xfd7zXZ\x00', ('.xz',), _xz_decompressor, _xz_compressor),
+	'zstd': ('\x28\xb5\x2f\xfd', ('.zst', '.zstd'), _zstd_decompressor, _zstd_compressor),
+}
+
+def _check_compression(compression):
+	"""Raises UnsupportedCompression if compression cannot be used here."""
+	if (compression not in COMPRESSIONS):
+		raise UnsupportedCompression, "Unknown compression: %s" % compression
+	if (compression == 'xz') and (lzma is None):
+		raise UnsupportedCompression, "xz compression requires the lzma module."
+	if (compression == 'zstd') and (zstandard is None):
+		raise UnsupportedCompression, "zstd compression requires the zstandard module."
+
+def compression_for_name(name):
+	"""Returns the compression implied by a file name's extension, or None."""
+	name = name.lower()
+	for i in COMPRESSIONS.keys():
+		for j in COMPRESSIONS[i][1]:
+			if name.endswith(j):
+				return i
+	return None
+
+class _DecompressingReader(object):
+	"""
+	A read-only file object that decompresses another file object as it is
+	read, using decompressors made by factory.  Concatenated streams, such
+	as multi-member gzip or multi-stream bz2 files, are decompressed one
+	after another.  With no factory the data is passed through unchanged.
+	
+	Only one piece of decompressed data is held at a time: gzip pieces are
+	at most chunksize bytes, and the other decompressors, which cannot cap
+	their output, are fed feedsize compressed bytes at a time, so a bz2
+	piece is about one block (900KB).
+	"""
+	
+	chunksize = 65536
+	feedsize = 128
+	
+	def __init__(self, fileobj, factory=None, prefix=''):
+		self.fileobj = fileobj
+		self.factory = factory
+		self.decompressor = factory and factory()
+		self.input = prefix
+		self.ended = False
+		self.buffer = ''
+		self.offset = 0
+		self.eof = False
+		self.name = getattr(fileobj, 'name', None)
+		
+	def _chunk(self):
+		"""Returns the next piece of decompressed data, or '' at the end."""
+		if (self.decompressor is None):
+			data = self.input or self.fileobj.read(self.chunksize)
+			self.input = ''
+			return data
+		limited = hasattr(self.decompressor, 'unconsumed_tail')
+		while True:
+			if not self.input:
+				if limited:
+					self.input = self.fileobj.read(self.chunksize)
+				else:
+					self.input = self.fileobj.read(self.feedsize)
+				if not self.input:
+					data = ''
+					if (not self.ended) and hasattr(self.decompressor, 'flush'):
+						data = self.decompressor.flush()
+					self.ended = True
+					return data
+			if self.ended:
+				if not self.input.strip('\x00'):
+					### Nothing but padding follows the stream.
+					self.input = ''
+					continue
+				self.decompressor = self.factory()
+				self.ended = False
+			try:
+				if limited:
+					data = self.decompressor.decompress(self.input, self.chunksize)
+					self.input = self.decompressor.unconsumed_tail
+				else:
+					data = self.decompressor.decompress(self.input[:self.feedsize])
+					self.input = self.input[self.feedsize:]
+			except EOFError:
+				### The last stream ended exactly where this input starts.
+				self.ended = True
+				continue
+			if getattr(self.decompressor, 'unused_data', ''):
+				### Another stream follows in the same input.  zlib also
+				### leaves it in unconsumed_tail.
+				if limited:
+					self.input = self.decompressor.unused_data
+				else:
+					self.input = self.decompressor.unused_data + self.input
+				self.ended = True
+			if data:
+				return data
+		
+	def read(self, size=-1):
+		pieces = []
+		while (size != 0) and not self.eof:
+			if (self.offset >= len(self.buffer)):
+				self.buffer = self._chunk()
+				self.offset = 0
+				if not self.buffer:
+					self.eof = True
+					break
+			end = len(self.buffer)
+			if (size > 0):
+				end = min(end, self.offset + size)
+				size -= end - self.offset
+			pieces.append(self.buffer[self.offset:end])
+			self.offset = end
+		return ''.join(pieces)
+		
+	def close(self):
+		self.fileobj.close()
+
+class _Lines(object):
+	"""Iterates over the lines of a file object that only supports read()."""
+	
+	def __init__(self, fileobj):
+		self.fileobj = fileobj
+		
+	def __iter__(self):
+		buffer = ''
+		start = 0
+		while True:
+			end = buffer.find('\n', start)
+			if (end < 0):
+				data = self.fileobj.read(65536)
+				if not data:
+					if (start < len(buffer)):
+						yield buffer[start:]
+					return
+				buffer = buffer[start:] + data
+				start = 0
+				continue
+			yield buffer[start:end+1]
+			start = end + 1
+
+class _CompressingWriter(object):
+	"""A write-only file object that compresses into another file object."""
+	
+	def __init__(self, fileobj, compressor):
+		self.fileobj = fileobj
+		self.compressor = compressor
+		
+	def write(self, data):
+		if isinstance(data, unicode):
+			data = data.encode('utf-8')
+		self.fileobj.write(self.compressor.compress(data))
+		
+	def flush(self):
+		self.fileobj.flush()
+		
+	def close(self):
+		self.fileobj.write(self.compressor.flush())
+		self.fileobj.close()
+
+def open_document(source, mode='rb', compression=None):
+	"""
+	Opens a Chartshare document, compressed or not, as a streaming file object.
+	
+	source is a file name or an open binary file object.  When reading, the
+	compression is detected from the document's magic bytes; when writing,
+	it is taken from the compression argument or else the file name's
+	extension.  gzip and bz2 are always available, xz needs the lzma module
+	and zstd the zstandard module.  Data is compressed and decompressed a
+	block at a time, so documents are never held in memory whole.
+	"""
+	
+	if isinstance(source, basestring):
+		name = source
+	else:
+		name = getattr(source, 'name', '')
+	
+	if not mode.startswith('r'):
+		### Checked before opening, so an unusable compression leaves no
+		### empty file behind.
+		if (compression is None) and isinstance(name, basestring):
+			compression = compression_for_name(name)
+		if (compression is not None):
+			_check_compression(compression)
+	
+	if isinstance(source, basestring):
+		fileobj = open(source, mode)
+	else:
+		fileobj = source
+	
+	if mode.startswith('r'):
+		prefix = fileobj.read(6)
+		factory = None
+		for i in COMPRESSIONS.keys():
+			if prefix.startswith(COMPRESSIONS[i][0]):
+				try:
+					_check_compression(i)
+				except UnsupportedCompression:
+					if (fileobj is not source):
+						fileobj.close()
+					raise
+				factory = COMPRESSIONS[i][2]
+		return _DecompressingReader(fileobj, factory, prefix)
+		
+	if (compression is None):
+		return fileobj
+	return _CompressingWriter(fileobj, COMPRESSIONS[compression][3]())
+
+_LEADING_ZERO = re.compile(r'^0(\.\d+)')
+_THOUSANDS = re.compile(r'(\d\d\d)(?=\d)(?!\d*\.)')
+
+class Util(object):
 	"""	Utility function mixin class for Chart and Chart subclasses."""
 	
+	__slots__ = ()
+	
 	def empty_array(self, values):
 		"""Returns an empty list of the same size as values."""
 		retval = []
@@ -43,23 +307,251 @@ class Util:
 
 	def reverse(self, value):
 		"""Reverse a string."""
-		strlist=list(value)
-		strlist.reverse()
-		return ''.join(strlist)
+		return value[::-1]
 
 	def commify(self, value):
 		"""Formats a number string according to chart conventions."""
 		if (value < 1):
 			value = "%g" % value
 		value=str(value)
-		r1 = re.compile(r'^0(\.\d+)')
-		r2 = re.compile(r'(\d\d\d)(?=\d)(?!\d*\.)')
 		if (value == '1000'):
 			return value
-		elif (r1.match(value)):
-			return r1.match(value).group(1)
+		elif (_LEADING_ZERO.match(value)):
+			return _LEADING_ZERO.match(value).group(1)
+		else:
+			return self.reverse(_THOUSANDS.sub(r'\1,',self.reverse(value)))
+		
+def _decode(value):
+	"""
+	Converts the byte strings in a display list argument to unicode, so
+	text compares the same before and after a JSON round trip.
+	"""
+	if isinstance(value, str):
+		try:
+			return value.decode('utf-8')
+		except UnicodeDecodeError:
+			return value.decode('latin-1')
+	elif isinstance(value, (list, tuple)):
+		return [_decode(i) for i in value]
+	elif isinstance(value, dict):
+		retval = {}
+		for i in value.keys():
+			retval[str(i)] = _decode(value[i])
+		return retval
+	return value
+
+def _encode(value):
+	"""Converts the unicode strings in a display list argument to utf-8 strings for R."""
+	if isinstance(value, unicode):
+		return value.encode('utf-8')
+	elif isinstance(value, list):
+		return [_encode(i) for i in value]
+	elif isinstance(value, dict):
+		retval = {}
+		for i in value.keys():
+			retval[str(i)] = _encode(value[i])
+		return retval
+	return value
+
+class DisplayList(object):
+	"""
+	A backend-neutral record of the primitives that draw a chart.
+	
+	Each item is a (primitive, arguments) pair.  The primitives are frame,
+	axis, margin_text, text, polyline, points and box; missing values in
+	points and polylines are stored as None, and text as unicode.  A
+	display list can be serialized, hashed, compared and replayed by any
+	backend (see RReplayer).
+	"""
+	
+	def __init__(self, items=None):
+		if (items is None):
+			items = []
+		self.items = items
+		
+	def __iter__(self):
+		return iter(self.items)
+		
+	def __len__(self):
+		return len(self.items)
+		
+	def __eq__(self, other):
+		return isinstance(other, DisplayList) and (self.items == other.items)
+		
+	def __ne__(self, other):
+		return not self.__eq__(other)
+		
+	def add(self, primitive, **args):
+		"""Appends a primitive, dropping arguments that were not given."""
+		for i in args.keys():
+			if (args[i] is None):
+				del(args[i])
+		self.items.append((primitive, _decode(args)))
+		
+	def frame(self, xlim, ylim, log='', pin=None, fg=None, bg=None):
+		"""Sets up an empty plotting region with the given limits."""
+		self.add('frame', xlim=list(xlim), ylim=list(ylim), log=log, pin=pin and list(pin), fg=fg, bg=bg)
+		
+	def axis(self, side, at, labels=None, tick=None, pos=None, width=None, size=None,
+			 perpendicular=None, color=None):
+		"""Adds a set of ticks, labelled when labels is given."""
+		self.add('axis', side=side, at=list(at), labels=labels and list(labels), tick=tick,
+			pos=pos, width=width, size=size, perpendicular=perpendicular, color=color)
+			
+	def margin_text(self, side, text, at=None, line=0, size=None, perpendicular=None,
+					expression=None):
+		"""Adds text in the margin on the given side of the plot."""
+		self.add('margin_text', side=side, text=text, at=at, line=line, size=size,
+			perpendicular=perpendicular, expression=expression)
+			
+	def text(self, x, y, text, color=None, anchor=None, size=None):
+		"""Adds text inside the plot; anchor places it below, left, above or right of (x, y)."""
+		self.add('text', x=x, y=y, text=text, color=color, anchor=anchor, size=size)
+		
+	def polyline(self, x, y, color=None, width=None):
+		"""Adds a line through the given points."""
+		self.add('polyline', x=list(x), y=list(y), color=color, width=width)
+		
+	def points(self, x, y, color=None, symbol=None, style='p'):
+		"""Adds a set of points drawn as glyphs ('p'), lines ('l') or both ('o')."""
+		self.add('points', x=list(x), y=list(y), color=color, symbol=symbol, style=style)
+		
+	def box(self, width=None):
+		"""Adds a box around the plot."""
+		self.add('box', width=width)
+		
+	def to_json(self):
+		"""Returns the display list serialized as a JSON string."""
+		return json.dumps(self.items, sort_keys=True, separators=(',', ':'))
+		
+	def from_json(cls, data):
+		"""Returns a display list from a string made by DisplayList.to_json()."""
+		items = []
+		for primitive, args in json.loads(data):
+			items.append((str(primitive), _decode(args)))
+		return cls(items)
+		
+	from_json = classmethod(from_json)
+	
+	def digest(self):
+		"""Returns a hex digest identifying the contents of the display list."""
+		return hashlib.sha1(self.to_json()).hexdigest()
+
+class RReplayer(object):
+	"""Draws a DisplayList through R."""
+	
+	formats = ('pdf', 'eps', 'png', 'jpg')
+	
+	def open_device(self, format, outfile):
+		"""Opens the R graphics device for the given format."""
+		if (format not in self.formats):
+			raise RenderError, "Unknown format: %s" % format
+		if (format == 'eps'):
+			r.postscript(file=outfile, onefile=0, height=8.5, width=11)
+		elif (format == 'png'):
+			r.png(file=outfile, width=1024, height=768)
+		elif (format == 'jpg'):
+			r.jpeg(file=outfile, width=1024, height=768, quality=75)
+		else:
+			r.pdf(file=outfile, height=8.5, width=11)
+			
+	def close_device(self):
+		"""Closes the current R graphics device."""
+		r.dev_off()
+		
+	def render(self, display_list, format, outfile):
+		"""Draws display_list into outfile in the given format."""
+		self.open_device(format, outfile)
+		try:
+			self.replay(display_list)
+		finally:
+			self.close_device()
+			
+	def replay(self, display_list):
+		"""Draws each primitive of display_list on the current device."""
+		for primitive, args in display_list:
+			getattr(self, '_' + primitive)(**_encode(args))
+			
+	def _missing(self, values):
+		"""Replaces missing values with R's NaN."""
+		retval = []
+		for i in values:
+			if (i is None):
+				retval.append('NaN')
+			else:
+				retval.append(i)
+		return retval
+		
+	def _frame(self, xlim, ylim, log='', pin=None, fg=None, bg=None):
+		if (pin is not None):
+			r.par(pin=pin, xaxs='i', yaxs='i', col_axis=fg, bg=bg, fg=fg)
+		x = range(xlim[0], xlim[1]+1)
+		r.plot(x=x, y=self._missing([None] * len(x)), xlim=xlim, ylim=ylim,
+			xlab='', ylab='', log=log, axes=False)
+			
+	def _axis(self, side, at, labels=None, tick=None, pos=None, width=None, size=None,
+			  perpendicular=None, color=None):
+		args = {}
+		if (labels is None):
+			labels = [''] * len(at)
+		if (tick is not None):
+			args['tck'] = tick
+		if (pos is not None):
+			args['pos'] = pos
+		if (width is not None):
+			args['lwd'] = width
+		if (size is not None):
+			args['cex_axis'] = size
+		if (perpendicular):
+			args['las'] = 2
+		if (color is not None):
+			args['col_axis'] = color
+		r.axis(side=side, at=at, labels=labels, **args)
+		
+	def _margin_text(self, side, text, at=None, line=0, size=None, perpendicular=None,
+					 expression=None):
+		args = {}
+		if (at is not None):
+			args['at'] = at
+		if (size is not None):
+			args['cex'] = size
+		if (perpendicular):
+			args['las'] = 2
+		if (expression):
+			text = r('expression(%s)' % text)
+		r.mtext(side=side, line=line, text=text, **args)
+		
+	def _text(self, x, y, text, color=None, anchor=None, size=None):
+		args = {}
+		if (color is not None):
+			args['col'] = color
+		if (anchor is not None):
+			args['pos'] = anchor
+		if (size is not None):
+			args['cex'] = size
+		r.text(x=x, y=y, labels=text, **args)
+		
+	def _polyline(self, x, y, color=None, width=None):
+		args = {}
+		if (color is not None):
+			args['col'] = color
+		if (width is not None):
+			args['lwd'] = width
+		r.lines(x=x, y=self._missing(y), **args)
+		
+	def _points(self, x, y, color=None, symbol=None, style='p'):
+		args = {}
+		if (color is not None):
+			args['col'] = color
+		if (symbol is not None):
+			args['pch'] = symbol
+		r.points(x=x, y=self._missing(y), type=style, **args)
+		
+	def _box(self, width=None):
+		if (width is not None):
+			r.box(lwd=width)
 		else:
-			return self.reverse(r2.sub(r'\1,',self.reverse(value)))
+			r.box()
 		
 class Element(object):
 	"""Base class for Chartshare vector elements."""
@@ -76,6 +568,103 @@ class Element(object):
 		
 	text = property(getText, setText)
 
+class _ElementStore(object):
+	"""
+	Dictionary-like storage for a Vector's elements, keyed by offset.
+	
+	Values for offsets start to end are kept in one array of doubles so
+	they can be shared with NumPy and Arrow without copying (see
+	Vector.to_numpy).  Missing values are stored as NaN and read back as
+	the string 'NaN', as they always have been.  Values that are not
+	floats are also kept as given in self.original, so they read back
+	unchanged, and values at other offsets are kept in self.extra.
+	"""
+	
+	def __init__(self, start, end):
+		self.start = start
+		self.end = end
+		self.values = array.array('d', [float('nan')]) * (end - start + 1)
+		self.original = {}
+		self.extra = {}
+		
+	def _index(self, offset):
+		if isinstance(offset, (int, long)) and (self.start <= offset <= self.end):
+			return offset - self.start
+		return None
+		
+	def __getitem__(self, offset):
+		i = self._index(offset)
+		if (i is None):
+			return self.extra[offset]
+		if (offset in self.original):
+			return self.original[offset]
+		value = self.values[i]
+		if (value != value):
+			return 'NaN'
+		return value
+		
+	def __setitem__(self, offset, value):
+		i = self._index(offset)
+		if (i is None):
+			self.extra[offset] = value
+			return
+		self.original.pop(offset, None)
+		if (value == 'NaN') or (value is None):
+			self.values[i] = float('nan')
+		elif isinstance(value, float):
+			self.values[i] = value
+		else:
+			self.original[offset] = value
+			try:
+				self.values[i] = float(value)
+			except (TypeError, ValueError):
+				self.values[i] = float('nan')
+			
+	def __delitem__(self, offset):
+		i = self._index(offset)
+		if (i is None):
+			del(self.extra[offset])
+		else:
+			self.original.pop(offset, None)
+			self.values[i] = float('nan')
+			
+	def unshared(self):
+		"""
+		Returns the offsets whose values are missing from self.values: those
+		outside start to end, and those that are not numbers.
+		"""
+		retval = self.extra.keys()
+		for i in self.original.keys():
+			try:
+				float(self.original[i])
+			except (TypeError, ValueError):
+				retval.append(i)
+		retval.sort()
+		return retval
+			
+	def __contains__(self, offset):
+		return (self._index(offset) is not None) or (offset in self.extra)
+		
+	def __iter__(self):
+		return iter(self.keys())
+		
+	def __len__(self):
+		return len(self.values) + len(self.extra)
+		
+	def get(self, offset, default=None):
+		if (offset in self):
+			return self[offset]
+		return default
+		
+	def keys(self):
+		return range(self.start, self.end+1) + self.extra.keys()
+		
+	def items(self):
+		return [(i, self[i]) for i in self.keys()]
+		
+	def __repr__(self):
+		return repr(dict(self.items()))
+
 class Vector(object):
 	"""Base class for Chartshare Vectors."""
 	def __init__(self, name='', color='black', linetype='o', symbol=1, 
@@ -86,13 +675,11 @@ class Vector(object):
 		self.symbol=symbol
 		self.start=start
 		self.end=end
-		self.elements={}
+		self.clutter=clutter
+		self.elements=_ElementStore(start, end)
+		self.hidden={}
 		self.debug=debug
 		self.continuous=continuous
-		
-		if not self.continuous:				
-			for i in range(self.start, self.end+1):
-				self.elements[i]='NaN'
 			
 	def getSymbol(self):
 		return self._symbol
@@ -147,6 +734,23 @@ class Vector(object):
 					retval.append(i)
 		return retval
 
+	def to_numpy(self):
+		"""
+		Returns the offsets and values of the Vector as NumPy arrays, with
+		missing values as NaN.  The values array shares memory with the
+		Vector, so later changes to the elements show through it.  Raises
+		ExportError if an element is outside start to end or is not a number.
+		"""
+		if (numpy is None):
+			raise ImportError, 'Vector.to_numpy() requires numpy.'
+		unshared = self.elements.unshared()
+		if unshared:
+			raise ExportError, 'Vector %s has elements outside %i to %i or that are not numbers, at offsets: %s' % (
+				self.name, self.elements.start, self.elements.end, ', '.join([str(i) for i in unshared]))
+		offsets = numpy.arange(self.elements.start, self.elements.end+1)
+		values = numpy.frombuffer(self.elements.values, dtype=numpy.float64)
+		return offsets, values
+
 	def to_xml(self, container=False):
 		"""Returns an xml representation of the Vector."""
 		if (container == False):
@@ -157,6 +761,8 @@ class Vector(object):
 		attrs[u'symbol'] = u"%s" % self.symbol
 		attrs[u'linetype'] = u"%s" % self.linetype
 		attrs[u'color'] = u"%s" % self.color
+		if self.clutter:
+			attrs[u'clutter'] = u"%s" % self.clutter
 		xml.startElement(u'vector', attrs)
 		for i in range(self.start, self.end+1):
 			if (self.elements[i] != 'NaN'):
@@ -167,17 +773,43 @@ class Vector(object):
 				xml.endElement(u'element')
 		xml.endElement(u'vector')
 			
-	def render(self):
-		"""Plots the current vector."""
+	def render(self, display_list=None):
+		"""
+		Plots the current vector.  The points are added to display_list
+		when one is given and drawn through R immediately otherwise.
+		"""
+		if (display_list is None):
+			display_list = DisplayList()
+			self.render(display_list)
+			RReplayer().replay(display_list)
+			return
+			
 		if (self.debug):
 			print "Rendering Vector: %s" % self.name
 			print self.elements
+		
+		x = range(self.start, self.end+1)
+		y = []
+		for i in x:
+			value = self.elements.get(i, 'NaN')
+			if (value == 'NaN'):
+				y.append(None)
+			else:
+				y.append(value)
+		
+		if (self.hidden):
+			### Points culled by Chart._declutter() are dropped from the
+			### glyphs only, so lines still pass through every value.
+			if (self.linetype == 'o'):
+				display_list.polyline(x=x, y=y, color=self.color)
+			for n in range(len(x)):
+				if (x[n] in self.hidden):
+					y[n] = None
+			display_list.points(x=x, y=y, color=self.color, symbol=self.symbol, style='p')
+		else:
+			display_list.points(x=x, y=y, color=self.color, symbol=self.symbol,
+				style=self.linetype)
 			
-		r.points(x=range(self.start, self.end+1),
-				 y=self.elements,
-				 col=self.color,
-				 type=self.linetype,
-				 pch=self.symbol)
 		if (self.debug):
 			print "Finished rendering Vector: %s" % self.name
 
@@ -235,18 +867,26 @@ class Phase(object):
 		xml.endElement(u'phase')
 
 			
-	def render(self):
-		"""Renders the phase change line."""
+	def render(self, display_list=None):
+		"""
+		Renders the phase change line.  The line is added to display_list
+		when one is given and drawn through R immediately otherwise.
+		"""
+		if (display_list is None):
+			display_list = DisplayList()
+			self.render(display_list)
+			RReplayer().replay(display_list)
+			return
 
 		x = [self.pos, self.pos]
 		y = [self.y_start, self._compute_y()]
 		
-		r.lines(x=x, y=y, col=self.color, lwd=self.width)
+		display_list.polyline(x=x, y=y, color=self.color, width=self.width)
 		
 		x=[self.pos, (self.pos+self.tail_length)]
 		y=[self._compute_y(), self._compute_y()]
 		
-		r.lines(x=x, y=y, col=self.color, lwd=self.width)
+		display_list.polyline(x=x, y=y, color=self.color, width=self.width)
 
 		if (self.tail_length < 0):
 			pos=2
@@ -255,11 +895,44 @@ class Phase(object):
 		else:
 			pos=4
 			
-		r.text(x=(self.pos + self.tail_length), y=self._compute_y(), col=self.color, pos=pos,
-			labels=self.label, cex=.75)
+		display_list.text(x=(self.pos + self.tail_length), y=self._compute_y(), color=self.color,
+			anchor=pos, text=self.label, size=.75)
+
+class AxisTable(object):
+	"""
+	Immutable tick positions and labels for one chart axis.  Tables are
+	kept in _axis_tables and shared by every chart with the same axis
+	parameters (see Chart._build_y and Chart._build_x).
+	"""
+	
+	__slots__ = ('y_start', 'y_end', 'ylim', 'myticks', 'mnyticks', 'mylabs', 'mnylabs',
+		'yticks', 'xticks', 'periods', 'mxticks', 'xlim')
+	
+	def __init__(self, **values):
+		for i in values.keys():
+			value = values[i]
+			if isinstance(value, list):
+				value = tuple(value)
+			object.__setattr__(self, i, value)
+			
+	def __setattr__(self, name, value):
+		raise AttributeError, 'AxisTable objects are read-only.'
 
-class Chart(object, Util):
+### Shared AxisTables, keyed by axis and parameters.
+_axis_tables = {}
+
+class Chart(Util):
 	"""Base class for celeration charts."""
+	
+	### Charts are built by the hundred thousand during ingestion, so they
+	### keep their settings in slots and their axes in shared AxisTables.
+	__slots__ = ('name', 'x_start', 'x_end', 'period', 'cycles', 'cycle_start', 'cycle_end',
+		'fg', 'bg', 'clutter', 'format', 'outfile', 'chart_type', 'title', 'debug', 'objects',
+		'device_status', '_y_axis', '_x_axis')
+	
+	### Size of the plotting region in inches, shared by every device.
+	pin = [8, 5.25]
+	
 	def __init__(self, name='', x_start=0, x_end=140, period=7, cycles=6,
 				 cycle_start=-3, cycle_end=3, fg='light blue', bg='white',
 				 clutter=4, format='pdf', outfile='figure', chart_type='daily',
@@ -268,7 +941,7 @@ class Chart(object, Util):
 		self.x_start=x_start
 		self.x_end=x_end
 		self.period=period
-		self.cycles=period
+		self.cycles=cycles
 		self.cycle_start=cycle_start
 		self.cycle_end=cycle_end
 		self.fg=fg
@@ -296,114 +969,213 @@ class Chart(object, Util):
 		attrs[u'name']= u"%s" % self.name
 		attrs[u'title'] = u"%s" % self.title
 		attrs[u'type'] = u"%s" % self.chart_type
+		if (self.clutter != 4):
+			attrs[u'clutter'] = u"%s" % self.clutter
 		xml.startElement(u'chart', attrs)
 		### Loop through each of the objects and call it's to_xml method. (rla)
 		for i in self.objects.keys():
 			self.objects[i].to_xml(container=container)
 		xml.endElement(u'chart')
-		container.seek(0)
+		if hasattr(container, 'seek'):
+			container.seek(0)
 		return container
 		
+	def save(self, path, compression=None):
+		"""
+		Writes the XML representation of the Chart to path, compressed
+		according to compression or the file name's extension (see
+		open_document).
+		"""
+		
+		container = open_document(path, 'wb', compression)
+		try:
+			self.to_xml(container=container)
+		finally:
+			container.close()
+		
 	def _start_R(self):
 		"""Imports the rpy module and starts a session."""
 		
-	def _open_device(self):
-		"""Creates and opens the plotting devices."""
-		if (self.format == 'eps'):
-			r.postscript(file=self.outfile, onefile=0, height=8.5, width=11)
-		elif (self.format == 'png'):
-			r.png(file=self.outfile, width=1024, height=768)
-		elif (self.format == 'jpg'):
-			r.jpeg(file=self.outfile, width=1024, height=768, quality=75)
-		else:
-			r.pdf(file=self.outfile, height=8.5, width=11)
+	def _open_device(self, format=None, outfile=None):
+		"""
+		Creates and opens the plotting devices.  The format and outfile
+		default to the chart's own settings.
+		"""
+		if (format is None):
+			format = self.format
+		if (outfile is None):
+			outfile = self.outfile
 			
-		r.par(pin=[8, 5.25], xaxs='i', yaxs='i', col_axis=self.fg, bg=self.bg, fg=self.fg)
+		RReplayer().open_device(format, outfile)
 		self.device_status=True
 		
 	def _build_y(self):
-		"""Builds the y axis for a Standard Celeration Chart."""
-		self.y_start = (10**self.cycle_start)
-		self.y_end = (10**self.cycle_end)
-		
-		self.ylim = [self.y_start, self.y_end]
-		
-		self.myticks=[]
-		self.mnyticks=[]
-		self.mylabs=[]
-		self.mnylabs=[]
-		self.yticks=[]
-		
-		for i in range(self.cycle_start, self.cycle_end+1):
-			increment=(10**i)
-			next_increment=(10**(i+1))
-			self.myticks.append(increment)
-			self.mylabs.append(self.commify(increment))
-			mnytick=((10**(i+1))/2)
-			if (mnytick < (10**self.cycle_end)):
-				self.mnyticks.append(mnytick)
-				self.mnylabs.append(self.commify(mnytick))
-				
-				for j in range(1, 10):
-					self.yticks.append(j*(10**i))	
-		self.yticks.append(10**self.cycle_end)
+		"""
+		Builds the y axis for a Standard Celeration Chart.  Charts with the
+		same cycles share one AxisTable, built the first time it is needed.
+		"""
+		key = ('y', self.cycle_start, self.cycle_end)
+		if (key not in _axis_tables):
+			y_start = (10**self.cycle_start)
+			y_end = (10**self.cycle_end)
+			
+			myticks=[]
+			mnyticks=[]
+			mylabs=[]
+			mnylabs=[]
+			yticks=[]
+			
+			for i in range(self.cycle_start, self.cycle_end+1):
+				increment=(10**i)
+				myticks.append(increment)
+				mylabs.append(self.commify(increment))
+				mnytick=((10**(i+1))/2)
+				if (mnytick < (10**self.cycle_end)):
+					mnyticks.append(mnytick)
+					mnylabs.append(self.commify(mnytick))
+					
+					for j in range(1, 10):
+						yticks.append(j*(10**i))	
+			yticks.append(10**self.cycle_end)
+			
+			_axis_tables[key] = AxisTable(y_start=y_start, y_end=y_end, ylim=(y_start, y_end),
+				myticks=myticks, mnyticks=mnyticks, mylabs=mylabs, mnylabs=mnylabs,
+				yticks=yticks)
+		self._y_axis = _axis_tables[key]
 					
 	def _build_x(self):
-		"""Builds the x axis for a Standard Celeration Chart."""
-		self.xticks = range(self.x_start, self.x_end+1)
-		self.periods = range(self.x_start, self.x_end+1, self.period)
-		self.mxticks = range(self.x_start, self.x_end+1, self.period*2)
-		self.xlim = [self.x_start, self.x_end]
+		"""
+		Builds the x axis for a Standard Celeration Chart.  Charts with the
+		same days and period share one AxisTable.
+		"""
+		key = ('x', self.x_start, self.x_end, self.period)
+		if (key not in _axis_tables):
+			_axis_tables[key] = AxisTable(xticks=range(self.x_start, self.x_end+1),
+				periods=range(self.x_start, self.x_end+1, self.period),
+				mxticks=range(self.x_start, self.x_end+1, self.period*2),
+				xlim=(self.x_start, self.x_end))
+		self._x_axis = _axis_tables[key]
+		
+	y_start = property(lambda self: self._y_axis.y_start)
+	y_end = property(lambda self: self._y_axis.y_end)
+	ylim = property(lambda self: self._y_axis.ylim)
+	myticks = property(lambda self: self._y_axis.myticks)
+	mnyticks = property(lambda self: self._y_axis.mnyticks)
+	mylabs = property(lambda self: self._y_axis.mylabs)
+	mnylabs = property(lambda self: self._y_axis.mnylabs)
+	yticks = property(lambda self: self._y_axis.yticks)
+	xticks = property(lambda self: self._x_axis.xticks)
+	periods = property(lambda self: self._x_axis.periods)
+	mxticks = property(lambda self: self._x_axis.mxticks)
+	xlim = property(lambda self: self._x_axis.xlim)
 		
-	def _plot_frame(self):
+	def __getstate__(self):
+		"""
+		Returns the chart's attributes for pickling.  The shared AxisTables
+		are left out and looked up again when the chart is unpickled.
+		"""
+		state = dict(getattr(self, '__dict__', {}))
+		for cls in self.__class__.__mro__:
+			for i in cls.__dict__.get('__slots__', ()):
+				if hasattr(self, i) and (i not in ('_y_axis', '_x_axis')):
+					state[i] = getattr(self, i)
+		return state
+		
+	def __setstate__(self, state):
+		for i in state.keys():
+			setattr(self, i, state[i])
+		self._build_y()
+		self._build_x()
+		
+	def _plot_frame(self, display_list):
 		"""Plots the frame for a Standard Celeration Chart."""
 		
-		blank_x = range(self.x_start, self.x_end+1)
-		blank_y=[]
-		for i in blank_x:
-			blank_y.append('NaN')
-		r.plot(x=blank_x, y=blank_y, xlim=self.xlim, ylim=self.ylim, 
-			xlab='', ylab='', log='y', axes=False)
+		display_list.frame(xlim=self.xlim, ylim=self.ylim, log='y', pin=self.pin,
+			fg=self.fg, bg=self.bg)
 
-		r.axis(side=2, at=self.myticks, las=2, labels=self.mylabs, tck=-0.02,
-			pos = self.x_start, lwd = 2, col_axis=self.fg)
+		display_list.axis(side=2, at=self.myticks, perpendicular=True, labels=self.mylabs,
+			tick=-0.02, pos=self.x_start, width=2, color=self.fg)
 			
-		r.axis(side=2, at=self.myticks, tck=1.02, pos=self.x_start,
-			labels=self.empty_array(self.myticks), lwd=2)
+		display_list.axis(side=2, at=self.myticks, tick=1.02, pos=self.x_start, width=2)
 
-		r.axis(side=2, at=self.mnyticks, las=2, labels=self.mnylabs, pos=self.x_start,
-			tck=-0.015, lwd=1.5, cex_axis=0.8)
+		display_list.axis(side=2, at=self.mnyticks, perpendicular=True, labels=self.mnylabs,
+			pos=self.x_start, tick=-0.015, width=1.5, size=0.8)
 
-		r.axis(side=2, at=self.mnyticks, las=2, labels=self.empty_array(self.mnyticks), tck=1.015,
-			lwd=1.5)
+		display_list.axis(side=2, at=self.mnyticks, perpendicular=True, tick=1.015, width=1.5)
 		
-		r.axis(side=2, at=self.yticks, labels=self.empty_array(self.yticks), pos=self.x_start, tck=1)
+		display_list.axis(side=2, at=self.yticks, pos=self.x_start, tick=1)
 
-		r.axis(side=1, at=self.mxticks, pos=self.y_start, lwd=2, labels=self.mxticks, tck=-0.01)		
+		display_list.axis(side=1, at=self.mxticks, pos=self.y_start, width=2, labels=self.mxticks,
+			tick=-0.01)
 		
-		r.axis(side=1, at=self.periods, pos=self.y_start, tck=-0.01, lwd=2, labels=self.empty_array(self.periods))
+		display_list.axis(side=1, at=self.periods, pos=self.y_start, tick=-0.01, width=2)
 		
-		r.axis(side=1, at=self.periods, pos=self.y_start, tck=1, labels=self.empty_array(self.periods), lwd=2)
+		display_list.axis(side=1, at=self.periods, pos=self.y_start, tick=1, width=2)
 		
-		r.axis(side=1, at=range(self.x_start, self.x_end), pos=self.y_start,
-			labels=self.empty_array(range(self.x_start, self.x_end)), tck=-0.01)
+		display_list.axis(side=1, at=range(self.x_start, self.x_end), pos=self.y_start, tick=-0.01)
 
-		r.axis(side=1, at=range(self.x_start,self.x_end), pos=self.y_start, tck=1,
-			labels=self.empty_array(range(self.x_start, self.x_end)))
+		display_list.axis(side=1, at=range(self.x_start, self.x_end), pos=self.y_start, tick=1)
 			
-		r.axis(side=3, at=self.periods, pos=self.y_end, lwd=2, tck=-0.01,cex_axis=0.5,
-			labels=self.empty_array(self.periods)) 
+		display_list.axis(side=3, at=self.periods, pos=self.y_end, width=2, tick=-0.01, size=0.5)
 
-		r.box(lwd=2)
+		display_list.box(width=2)
 			
-	def _plot_objects(self):
+	def _declutter(self):
+		"""
+		Culls vector points that would be drawn on top of an identical glyph.
+		
+		The plotting region is divided into a grid of cells self.clutter
+		points (1/72 inch) on a side, and a point is hidden when a point
+		with the same symbol and color, from this or any other vector, has
+		already claimed its cell.  A vector's own clutter setting, when
+		non-zero, overrides the chart's; a tolerance of 0 disables culling.
+		Vectors drawn as plain lines have no glyphs and are left alone.
+		"""
+		
+		width, height = self.pin
+		x_scale = (width * 72.0) / max(abs(self.x_end - self.x_start), 1)
+		y_base = math.log10(self.y_start)
+		y_scale = (height * 72.0) / max(abs(math.log10(self.y_end) - y_base), 1)
+		
+		occupied = {}
+		names = self.objects.keys()
+		names.sort()
+		for i in names:
+			v = self.objects[i]
+			if not isinstance(v, Vector):
+				continue
+			v.hidden = {}
+			tolerance = v.clutter or self.clutter
+			if (tolerance <= 0) or (v.linetype == 'l'):
+				continue
+			
+			for offset in range(v.start, v.end+1):
+				try:
+					value = float(v.elements.get(offset, 'NaN'))
+				except (TypeError, ValueError):
+					continue
+				if not (0 < value < float('inf')):
+					continue
+				cell = (tolerance, v.symbol, v.color,
+					int(math.floor((offset - self.x_start) * x_scale / tolerance)),
+					int(math.floor((math.log10(value) - y_base) * y_scale / tolerance)))
+				if (cell in occupied):
+					v.hidden[offset] = occupied[cell]
+				else:
+					occupied[cell] = v.name
+			
+			if (self.debug and v.hidden):
+				print "Culled %i cluttered points from Vector: %s" % (len(v.hidden), v.name)
+	
+	def _plot_objects(self, display_list):
 		"""Plots all objects in the object dictionary."""
 
+		self._declutter()
 		for i in self.objects.keys():
 			self.objects[i].debug = self.debug
-			self.objects[i].render()
+			self.objects[i].render(display_list)
 	
-	def _decorate(self):
+	def _decorate(self, display_list):
 		"""
 		This is a stub for the _decorate method that adds top labels, 
 		left axis notations, etc.  Chart._decorate() should do something 
@@ -427,86 +1199,138 @@ class Chart(object, Util):
 		r.dev_off()
 		self.device_status=False
 		
+	def display_list(self):
+		"""
+		Returns a DisplayList with everything needed to draw the chart.
+		Building it does not touch R, so it can be done in any process.
+		"""
+		
+		display_list = DisplayList()
+		self._plot_frame(display_list)
+		self._plot_objects(display_list)
+		self._decorate(display_list)
+		return display_list
+		
 	def render(self):
 		"""Renders the Standard Celeration Chart."""
 
+		display_list = self.display_list()
 		self._start_R()
 		self._open_device()
-		self._plot_frame()
-		self._plot_objects()
-		self._decorate()
+		RReplayer().replay(display_list)
 		self._close_device()
+		
+	def render_formats(self, formats=('pdf', 'png', 'eps'), outfile=None, as_bytes=False,
+					   parallel=True):
+		"""
+		Renders the chart once and writes it out in each of the given formats.
+		
+		The chart's display list is built a single time and replayed onto a
+		device for every format.  Vector formats (pdf and eps) are written in
+		this process; raster formats (png and jpg) are written in parallel,
+		each in a forked copy of the R session, unless parallel is false.
+		Files are named outfile plus the format as an extension; outfile
+		defaults to the chart's outfile without its extension.
+		
+		Returns a dictionary mapping each format to its file name, or to the
+		contents of the file when as_bytes is true.
+		"""
+		
+		if (outfile is None):
+			outfile = os.path.splitext(self.outfile)[0]
+		
+		paths = {}
+		for i in formats:
+			if (i not in RReplayer.formats):
+				raise RenderError, "Unknown format: %s" % i
+			paths[i] = "%s.%s" % (outfile, i)
+		
+		display_list = self.display_list()
+		self._start_R()
+		replayer = RReplayer()
+		
+		workers = []
+		for i in paths.keys():
+			if (parallel and (i in ('png', 'jpg'))):
+				worker = multiprocessing.Process(target=replayer.render,
+					args=(display_list, i, paths[i]))
+				worker.start()
+				workers.append((i, worker))
+		for i in paths.keys():
+			if not (parallel and (i in ('png', 'jpg'))):
+				replayer.render(display_list, i, paths[i])
+		for i, worker in workers:
+			worker.join()
+			if (worker.exitcode != 0):
+				raise RenderError, 'Rendering to %s failed.' % paths[i]
+		
+		if (as_bytes):
+			for i in paths.keys():
+				f = open(paths[i], 'rb')
+				try:
+					paths[i] = f.read()
+				finally:
+					f.close()
+		return paths
 
 class DailyPerMinuteChart(Chart):
 	"""Daily/Minute Standard Celeration Chart."""
 	
-	def _decorate(self):
+	__slots__ = ()
+	
+	def _decorate(self, display_list):
 		"""Adds decorations to the daily celeration chart."""
 		
 		toplabs = range(0,21,4)
 		toppos = range(0,141,28)
-		r.axis(side=3, at=toppos, labels=toplabs, lwd=2, tck=-0.01)
+		display_list.axis(side=3, at=toppos, labels=toplabs, width=2, tick=-0.01)
 		
-		r.mtext(side=3, at=1, line=0, cex=0.4, text='M')
-		r.mtext(side=3, at=3, line=0, cex=0.4, text='W')
-		r.mtext(side=3, at=5, line=0, cex=0.4, text='F')
-		r.mtext(side=3, at=7, line=0.5, cex=0.4, text='SUN', las=2)
-		r.mtext(side=3, at=42, line=2, text='SUCCESSIVE')
-		r.mtext(side=3, at=70, line=2, text='CALENDAR')
-		r.mtext(side=3, at=98, line=2, text='WEEKS')
-		r.mtext(side=3, line=4, cex=1.2, text=self.title)
+		display_list.margin_text(side=3, at=1, line=0, size=0.4, text='M')
+		display_list.margin_text(side=3, at=3, line=0, size=0.4, text='W')
+		display_list.margin_text(side=3, at=5, line=0, size=0.4, text='F')
+		display_list.margin_text(side=3, at=7, line=0.5, size=0.4, text='SUN', perpendicular=True)
+		display_list.margin_text(side=3, at=42, line=2, text='SUCCESSIVE')
+		display_list.margin_text(side=3, at=70, line=2, text='CALENDAR')
+		display_list.margin_text(side=3, at=98, line=2, text='WEEKS')
+		display_list.margin_text(side=3, line=4, size=1.2, text=self.title)
 		
-		r.mtext(side=2, at=10, line=3, text='COUNT PER MINUTE')
+		display_list.margin_text(side=2, at=10, line=3, text='COUNT PER MINUTE')
 		
-		r.mtext(side=1, line=2, text='SUCCESSIVE CALENDAR DAYS')
+		display_list.margin_text(side=1, line=2, text='SUCCESSIVE CALENDAR DAYS')
 		
-		r.mtext(side=4, line=1, text='COUNTING TIMES', at=40, cex=0.75)
+		display_list.margin_text(side=4, line=1, text='COUNTING TIMES', at=40, size=0.75)
 		
 		rightpos= [.001,    .002,   .005,   .01,   .02,   .05,    .1,   .2,   .5,    1,     2,     3,    4,     6]
 		rightlabs=["1000'", "500'", "200'", "100'", "50'", "20'", "10'", "5'", "2'", "1'", '30"', '20"', '15"', '10"']
 		
-		r.axis(side=4, las=2, at=rightpos, labels=rightlabs, tck=-0.02, cex_axis=0.75)
+		display_list.axis(side=4, perpendicular=True, at=rightpos, labels=rightlabs, tick=-0.02, size=0.75)
 		
-		r.mtext(side=4, las=2, at=0.025, text='hrs', line=3, cex=0.75)
-		r.mtext(side=4, las=2, at=1, text='min', line=3, cex=0.75)
-		r.mtext(side=4, las=2, at=6, text='sec', line=3, cex=0.75)
+		display_list.margin_text(side=4, perpendicular=True, at=0.025, text='hrs', line=3, size=0.75)
+		display_list.margin_text(side=4, perpendicular=True, at=1, text='min', line=3, size=0.75)
+		display_list.margin_text(side=4, perpendicular=True, at=6, text='sec', line=3, size=0.75)
 		
-		r.mtext(side=4, las=2, at=0.001, line=4, cex=0.075, text=r('expression(- 16*degree)'))
-		r.mtext(side=4, las=2, at=0.002, line=4, cex=0.075, text=r('expression(- 8*degree)'))
-		r.mtext(side=4, las=2, at=0.004, line=4, cex=0.075, text=r('expression(- 4*degree)'))
-		r.mtext(side=4, las=2, at=0.008, line=4, cex=0.075, text=r('expression(- 2*degree)'))
-		r.mtext(side=4, las=2, at=0.015, line=4, cex=0.075, text=r('expression(- 1*degree)'))
+		display_list.margin_text(side=4, perpendicular=True, at=0.001, line=4, size=0.075, text='- 16*degree', expression=True)
+		display_list.margin_text(side=4, perpendicular=True, at=0.002, line=4, size=0.075, text='- 8*degree', expression=True)
+		display_list.margin_text(side=4, perpendicular=True, at=0.004, line=4, size=0.075, text='- 4*degree', expression=True)
+		display_list.margin_text(side=4, perpendicular=True, at=0.008, line=4, size=0.075, text='- 2*degree', expression=True)
+		display_list.margin_text(side=4, perpendicular=True, at=0.015, line=4, size=0.075, text='- 1*degree', expression=True)
 		
 class YearlyChart(Chart):
 	"""Yearly Standard Celeration Chart."""
 	
+	__slots__ = ('century',)
+	
 	def __init__(self, name='', x_start=0, x_end=100, period=5, cycles=6, cycle_start=0,
 		cycle_end=6, fg='light blue', bg='white', clutter=4, format='pdf', outfile='figure',
 		chart_type='yearly', title='', century=1900, debug=False):
 		
-		self.name=name
-		self.x_start=x_start
-		self.x_end=x_end
-		self.period=period
-		self.cycles=cycles
-		self.cycle_start=cycle_start
-		self.cycle_end=cycle_end
-		self.fg=fg
-		self.bg=bg
-		self.clutter=clutter
-		self.format=format
-		self.outfile=outfile
-		self.chart_type=chart_type
-		self.title=title
+		Chart.__init__(self, name=name, x_start=x_start, x_end=x_end, period=period, cycles=cycles,
+			cycle_start=cycle_start, cycle_end=cycle_end, fg=fg, bg=bg, clutter=clutter,
+			format=format, outfile=outfile, chart_type=chart_type, title=title, debug=debug)
 		self.century=century
-		self.debug=debug
-		self.objects={}
-		
-		self._build_y()
-		self._build_x()
 
 		
-	def _decorate(self):
+	def _decorate(self, display_list):
 		"""Decorates the yearly Standard Celeration Chart."""
 		
 		toplabs=[]
@@ -516,115 +1340,74 @@ class YearlyChart(Chart):
 			
 		toplabs.pop()
 		
-		r.mtext(side=2, line=4, text='COUNT PER YEAR')
-		r.mtext(side=1, line=3, text='SUCCESSIVE CALENDAR YEARS')
-		r.mtext(side=3, line=5, text='CALENDAR DECADES')
-		r.mtext(side=3, line=4, text='0', at=0)
-		r.mtext(side=3, line=4, text='5', at=50)
-		r.mtext(side=3, line=4, text='10', at=100)
+		display_list.margin_text(side=2, line=4, text='COUNT PER YEAR')
+		display_list.margin_text(side=1, line=3, text='SUCCESSIVE CALENDAR YEARS')
+		display_list.margin_text(side=3, line=5, text='CALENDAR DECADES')
+		display_list.margin_text(side=3, line=4, text='0', at=0)
+		display_list.margin_text(side=3, line=4, text='5', at=50)
+		display_list.margin_text(side=3, line=4, text='10', at=100)
 		
-		r.axis(side=3, at=self.periods, labels=toplabs, lwd=2, tck=-0.01, cex_axis=0.5)
+		display_list.axis(side=3, at=self.periods, labels=toplabs, width=2, tick=-0.01, size=0.5)
 		
 class DailyPerDayChart(Chart):
 	"""DAILY per day Celeration Chart."""
 	
+	__slots__ = ()
+	
 	def __init__(self, name='', x_start=0, x_end=140, period=7, cycles=6,
 				 cycle_start=0, cycle_end=6, fg='light blue', bg='white',
 				 clutter=4, format='pdf', outfile='figure', chart_type='DailyPerDay',
 				 title='DAILY per day CHART', debug=False):
-				 
-		self.x_start=x_start
-		self.x_end=x_end
-		self.period=period
-		self.cycles=period
-		self.cycle_start=cycle_start
-		self.cycle_end=cycle_end
-		self.fg=fg
-		self.bg=bg
-		self.clutter=clutter
-		self.format=format
-		self.outfile=outfile
-		self.chart_type=chart_type
-		self.title=title
-		self.debug=debug
-		self.name=name
-		self.objects={}
-		self._build_y()
-		self._build_x()
+		
+		Chart.__init__(self, name=name, x_start=x_start, x_end=x_end, period=period, cycles=cycles,
+			cycle_start=cycle_start, cycle_end=cycle_end, fg=fg, bg=bg, clutter=clutter,
+			format=format, outfile=outfile, chart_type=chart_type, title=title, debug=debug)
 
-	def _decorate(self):
+	def _decorate(self, display_list):
 		"""Adds decorations to the daily celeration chart."""
 		
 		toplabs = range(0,21,4)
 		toppos = range(0,141,28)
-		r.axis(side=3, at=toppos, labels=toplabs, lwd=2, tck=-0.01)
+		display_list.axis(side=3, at=toppos, labels=toplabs, width=2, tick=-0.01)
 		
-		r.mtext(side=3, at=1, line=0, cex=0.4, text='M')
-		r.mtext(side=3, at=3, line=0, cex=0.4, text='W')
-		r.mtext(side=3, at=5, line=0, cex=0.4, text='F')
-		r.mtext(side=3, at=7, line=0.5, cex=0.4, text='SUN', las=2)
-		r.mtext(side=3, at=42, line=2, text='SUCCESSIVE')
-		r.mtext(side=3, at=70, line=2, text='CALENDAR')
-		r.mtext(side=3, at=98, line=2, text='WEEKS')
-		r.mtext(side=3, line=4, cex=1.2, text=self.title)
+		display_list.margin_text(side=3, at=1, line=0, size=0.4, text='M')
+		display_list.margin_text(side=3, at=3, line=0, size=0.4, text='W')
+		display_list.margin_text(side=3, at=5, line=0, size=0.4, text='F')
+		display_list.margin_text(side=3, at=7, line=0.5, size=0.4, text='SUN', perpendicular=True)
+		display_list.margin_text(side=3, at=42, line=2, text='SUCCESSIVE')
+		display_list.margin_text(side=3, at=70, line=2, text='CALENDAR')
+		display_list.margin_text(side=3, at=98, line=2, text='WEEKS')
+		display_list.margin_text(side=3, line=4, size=1.2, text=self.title)
 		
-		r.mtext(side=2, at=1000, line=4, text='COUNT PER DAY')
+		display_list.margin_text(side=2, at=1000, line=4, text='COUNT PER DAY')
 		
-		r.mtext(side=1, line=2, text='SUCCESSIVE CALENDAR DAYS')
+		display_list.margin_text(side=1, line=2, text='SUCCESSIVE CALENDAR DAYS')
 		
 class WeeklyPerWeekChart(Chart):
 	"""Weekly/Week Standard Celeration Chart."""
 	
+	__slots__ = ()
+	
 	def __init__(self, name='', x_start=0, x_end=100, period=5, cycles=6, cycle_start=0,
 		cycle_end=6, fg='light blue', bg='white', clutter=4, format='pdf', outfile='figure',
 		chart_type='weekly', title='WEEKLY per week CHART', debug=False):
 		
-		self.name=name
-		self.x_start=x_start
-		self.x_end=x_end
-		self.period=period
-		self.cycles=cycles
-		self.cycle_start=cycle_start
-		self.cycle_end=cycle_end
-		self.fg=fg
-		self.bg=bg
-		self.clutter=clutter
-		self.format=format
-		self.outfile=outfile
-		self.chart_type=chart_type
-		self.title=title
-		self.debug=debug
-		self.objects={}
-		
-		self._build_y()
-		self._build_x()
+		Chart.__init__(self, name=name, x_start=x_start, x_end=x_end, period=period, cycles=cycles,
+			cycle_start=cycle_start, cycle_end=cycle_end, fg=fg, bg=bg, clutter=clutter,
+			format=format, outfile=outfile, chart_type=chart_type, title=title, debug=debug)
 
 class MonthlyPerMonthChart(Chart):
 	"""Monthly/Month Standard Celeration Chart."""
 	
+	__slots__ = ()
+	
 	def __init__(self, name='', x_start=0, x_end=120, period=6, cycles=6, cycle_start=0,
 		cycle_end=6, fg='light blue', bg='white', clutter=4, format='pdf', outfile='figure',
 		chart_type='monthly', title='MONTHLY per month CHART', debug=False):
 		
-		self.name=name
-		self.x_start=x_start
-		self.x_end=x_end
-		self.period=period
-		self.cycles=cycles
-		self.cycle_start=cycle_start
-		self.cycle_end=cycle_end
-		self.fg=fg
-		self.bg=bg
-		self.clutter=clutter
-		self.format=format
-		self.outfile=outfile
-		self.chart_type=chart_type
-		self.title=title
-		self.debug=debug
-		self.objects={}
-		
-		self._build_y()
-		self._build_x()
+		Chart.__init__(self, name=name, x_start=x_start, x_end=x_end, period=period, cycles=cycles,
+			cycle_start=cycle_start, cycle_end=cycle_end, fg=fg, bg=bg, clutter=clutter,
+			format=format, outfile=outfile, chart_type=chart_type, title=title, debug=debug)
 		
 class ChartHandler(ContentHandler):
 	"""SAX handler to process Chartshare XML files."""
@@ -669,6 +1452,12 @@ class ChartHandler(ContentHandler):
 				self.root.outfile = str(attrs.get('outfile'))
 			else:
 				self.root.outfile = (self.out_format % self.chart_count) + '.' + self.root.format
+			
+			if (attrs.get('clutter')):
+				try:
+					self.root.clutter = float(attrs.get('clutter'))
+				except ValueError:
+					raise LengthTypeError, 'clutter must be a valid number.'
 				
 		elif (name == 'vector'):
 			self.isVector = True
@@ -696,6 +1485,11 @@ class ChartHandler(ContentHandler):
 					self.v.continuous=False
 				else:
 					self.v.continuous=True
+			if (attrs.get('clutter')):
+				try:
+					self.v.clutter = float(attrs.get('clutter'))
+				except ValueError:
+					raise LengthTypeError, 'clutter must be a valid number.'
 								
 		elif (name == 'element'):
 			self.isElement=True
@@ -804,10 +1598,534 @@ class ChartFactory(object):
 		self.saxparser.setContentHandler(self.handler)
 		
 	def parse(self, xml):
-		"""Parses an xml string and returns a Chart object."""
-		self.saxparser.parse(xml)
+		"""
+		Parses an xml file name, URL or file object and returns a Chart
+		object.  Compressed documents are decompressed as they are parsed.
+		"""
+		if isinstance(xml, basestring) and not os.path.exists(xml):
+			self.saxparser.parse(xml)
+			return self.handler.get_chart()
+		
+		source = open_document(xml)
+		try:
+			self.saxparser.parse(source)
+		finally:
+			if isinstance(xml, basestring):
+				source.close()
 		return self.handler.get_chart()
 
+def _to_date(value):
+	"""
+	Converts a date, datetime, epoch seconds, or a string holding epoch
+	seconds or an ISO date, to a date.
+	"""
+	if isinstance(value, datetime.datetime):
+		return value.date()
+	elif isinstance(value, datetime.date):
+		return value
+	try:
+		if isinstance(value, basestring):
+			try:
+				value = float(value)
+			except ValueError:
+				return datetime.date(*[int(i) for i in value.strip()[:10].split('-')])
+		return datetime.date.fromtimestamp(value)
+	except (TypeError, ValueError, OverflowError):
+		raise InvalidObservation, 'Invalid timestamp: %r' % (value,)
+
+class RateIngester(object):
+	"""
+	Builds per minute charts from a stream of timed observations.
+	
+	Each observation is a learner, a behavior, a timestamp, a count and the
+	counting time in minutes.  Every learner gets a chart (chart_class,
+	named after the learner and rendered to a file of the same name) and every behavior a pair of vectors: the
+	count per minute, named after the behavior, and the record floor
+	(1 / counting time, the chart's counting times axis), named behavior
+	plus ' floor'.  Days are offsets from start.
+	
+	When a learner has several timings of a behavior on one day, policy
+	picks the day's value: 'best' keeps the timing with the highest rate,
+	'sum' divides the total count by the total counting time, and 'last'
+	keeps the timing received last.  Only the open day of each learner
+	and behavior is held outside the vectors, and it is written to them as
+	soon as a later day arrives, so memory does not grow with the stream.
+	Observations outside the chart's days are counted in self.dropped.
+	"""
+	
+	policies = ('best', 'sum', 'last')
+	
+	def __init__(self, start, policy='best', chart_class=DailyPerMinuteChart):
+		if (policy not in self.policies):
+			raise InvalidObservation, "policy must be one of %s." % ', '.join(self.policies)
+		self.start = _to_date(start)
+		self.policy = policy
+		self.chart_class = chart_class
+		self.charts = {}
+		self.days = {}
+		self.dropped = 0
+		
+	def _chart(self, learner):
+		"""Returns the chart for a learner."""
+		if (learner not in self.charts):
+			chart = self.chart_class(name=learner)
+			chart.outfile = "%s.%s" % (learner, chart.format)
+			self.charts[learner] = chart
+		return self.charts[learner]
+		
+	def _vectors(self, learner, behavior):
+		"""Returns the rate and floor vectors for a learner and behavior."""
+		chart = self._chart(learner)
+		if (behavior not in chart.objects):
+			chart.objects[behavior] = Vector(name=behavior, start=chart.x_start,
+				end=chart.x_end, linetype='p')
+			chart.objects[behavior + ' floor'] = Vector(name=behavior + ' floor',
+				start=chart.x_start, end=chart.x_end, linetype='p', symbol='-')
+		return chart.objects[behavior], chart.objects[behavior + ' floor']
+		
+	def _merge(self, day, count, minutes):
+		"""Combines a day's [count, minutes] with another timing."""
+		if (day is None) or (self.policy == 'last'):
+			return [count, minutes]
+		elif (self.policy == 'sum'):
+			return [day[0] + count, day[1] + minutes]
+		elif ((count / minutes) > (day[0] / day[1])):
+			return [count, minutes]
+		return day
+		
+	def _write(self, key, offset, day):
+		"""Writes a day's rate and record floor to its vectors."""
+		rate, floor = self._vectors(*key)
+		rate.elements[offset] = day[0] / day[1]
+		floor.elements[offset] = 1.0 / day[1]
+		
+	def _read(self, key, offset):
+		"""Recovers a day already written to the vectors as [count, minutes]."""
+		rate, floor = self._vectors(*key)
+		if (floor.elements.get(offset, 'NaN') == 'NaN'):
+			return None
+		minutes = 1.0 / floor.elements[offset]
+		return [rate.elements[offset] * minutes, minutes]
+		
+	def add(self, learner, behavior, timestamp, count, minutes):
+		"""Adds one timed observation."""
+		try:
+			count = float(count)
+			minutes = float(minutes)
+		except (TypeError, ValueError):
+			raise InvalidObservation, 'count and counting time must be numbers.'
+		if (count < 0) or (minutes <= 0):
+			raise InvalidObservation, 'count must not be negative and counting time must be positive.'
+		
+		chart = self._chart(learner)
+		offset = (_to_date(timestamp) - self.start).days
+		if (offset < chart.x_start) or (offset > chart.x_end):
+			self.dropped += 1
+			return
+		
+		key = (learner, behavior)
+		if (key in self.days) and (self.days[key][0] == offset):
+			day = self.days[key][1]
+		else:
+			if (key in self.days):
+				self._write(key, *self.days[key])
+			day = self._read(key, offset)
+		self.days[key] = (offset, self._merge(day, count, minutes))
+		
+	def ingest(self, observations):
+		"""
+		Adds each (learner, behavior, timestamp, count, minutes) observation
+		from an iterable and returns the charts, keyed by learner.
+		"""
+		for i in observations:
+			self.add(*i)
+		return self.flush()
+		
+	def flush(self):
+		"""Writes every open day to the vectors and returns the charts."""
+		for key in self.days.keys():
+			self._write(key, *self.days[key])
+		self.days.clear()
+		return self.charts
+
+def read_observations(source):
+	"""
+	Yields (learner, behavior, timestamp, count, minutes) observations from
+	a CSV document with those column headings.  source is a file name or a
+	file object and may be compressed (see open_document).
+	"""
+	
+	f = open_document(source)
+	try:
+		for row in csv.DictReader(_Lines(f)):
+			yield (row['learner'], row['behavior'], row['timestamp'], row['count'], row['minutes'])
+	finally:
+		if isinstance(source, basestring):
+			f.close()
+
+def _as_charts(charts):
+	"""Accepts a single Chart or an iterable of Charts."""
+	if isinstance(charts, Chart):
+		return [charts]
+	return charts
+
+def _phase_ids(chart, offsets):
+	"""
+	Numbers the phases of a chart for each offset: 0 before the first
+	phase change line, 1 after it, and so on.
+	"""
+	positions = [i.pos for i in chart.objects.values() if isinstance(i, Phase)]
+	positions.sort()
+	return numpy.searchsorted(numpy.array(positions, dtype=numpy.float64), offsets,
+		side='right').astype(numpy.int32)
+
+def export_arrow(charts):
+	"""
+	Returns the vectors of a chart, or of an iterable of charts, as a
+	pyarrow Table with chart, vector, offset, value and phase columns.
+	
+	Each vector is one chunk of the table, and its value chunk shares
+	memory with the vector (see Vector.to_numpy), so even very large
+	corpora are exported without copying the data.  Missing values are NaN.
+	"""
+	
+	if (numpy is None) or (pyarrow is None):
+		raise ImportError, 'export_arrow() requires numpy and pyarrow.'
+	
+	columns = {'chart': [], 'vector': [], 'offset': [], 'value': [], 'phase': []}
+	for chart in _as_charts(charts):
+		names = chart.objects.keys()
+		names.sort()
+		for i in names:
+			v = chart.objects[i]
+			if not isinstance(v, Vector):
+				continue
+			offsets, values = v.to_numpy()
+			zeros = pyarrow.array(numpy.zeros(len(offsets), dtype=numpy.int32))
+			columns['chart'].append(pyarrow.DictionaryArray.from_arrays(zeros,
+				pyarrow.array([chart.name], type=pyarrow.string())))
+			columns['vector'].append(pyarrow.DictionaryArray.from_arrays(zeros,
+				pyarrow.array([v.name], type=pyarrow.string())))
+			columns['offset'].append(pyarrow.array(offsets))
+			columns['value'].append(pyarrow.array(values))
+			columns['phase'].append(pyarrow.array(_phase_ids(chart, offsets)))
+	
+	names = ['chart', 'vector', 'offset', 'value', 'phase']
+	types = [pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+		pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+		pyarrow.int64(), pyarrow.float64(), pyarrow.int32()]
+	return pyarrow.Table.from_arrays(
+		[pyarrow.chunked_array(columns[names[i]], type=types[i]) for i in range(len(names))],
+		names=names)
+
+def export_pandas(charts):
+	"""
+	Returns the vectors of a chart, or of an iterable of charts, as a
+	pandas DataFrame with the same columns as export_arrow().  The chart
+	and vector columns are categorical.  Joining the vectors into one
+	frame takes a single vectorized copy of the values.
+	"""
+	
+	if (pandas is None):
+		raise ImportError, 'export_pandas() requires pandas.'
+	return export_arrow(charts).to_pandas()
+
+def find_documents(paths):
+	"""
+	Expands a list of files, directories and glob patterns into a sorted
+	list of (path, name) pairs for Chartshare documents.  Directories are
+	searched recursively for .xml files, compressed or not, and name is a
+	document's path relative to the directory it was found in; for files
+	and glob matches it is the file name.
+	"""
+	
+	found = {}
+	for i in paths:
+		if os.path.isdir(i):
+			for root, dirs, files in os.walk(i):
+				for j in files:
+					if _strip_compression(j).lower().endswith('.xml'):
+						path = os.path.join(root, j)
+						found[path] = os.path.relpath(path, i)
+		else:
+			for j in (glob.glob(i) or [i]):
+				found.setdefault(j, os.path.basename(j))
+	retval = found.items()
+	retval.sort()
+	return retval
+
+def _strip_compression(path):
+	"""Returns path without its compression extension, if it has one."""
+	
+	compression = compression_for_name(path)
+	if (compression is not None):
+		for i in COMPRESSIONS[compression][1]:
+			if path.lower().endswith(i):
+				return path[:-len(i)]
+	return path
+
+def _document_base(path):
+	"""Returns path without its .xml and compression extensions."""
+	
+	path = _strip_compression(path)
+	if path.lower().endswith('.xml'):
+		return path[:-4]
+	return path
+
+def _digest_file(path):
+	"""Returns the sha1 hex digest of a file's contents."""
+	
+	digest = hashlib.sha1()
+	f = open(path, 'rb')
+	try:
+		while True:
+			block = f.read(65536)
+			if not block:
+				break
+			digest.update(block)
+	finally:
+		f.close()
+	return digest.hexdigest()
+
+def _document_stamp(path, check):
+	"""
+	Returns the value recorded in the checkpoint for a document: its
+	modification time for the mtime check, or its content digest for the
+	hash check.
+	"""
+	
+	if (check == 'hash'):
+		return _digest_file(path)
+	return "mtime:%r" % os.path.getmtime(path)
+
+### Shared with the batch workers: the pid of the worker rendering each
+### job (0 before it starts, -1 once it is done) and when it started.
+_job_pids = None
+_job_starts = None
+
+def _init_worker(pids, starts):
+	"""
+	Leaves interrupts to the parent process, which stops the pool, and
+	keeps the arrays the workers report their jobs in.
+	"""
+	
+	global _job_pids, _job_starts
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	_job_pids = pids
+	_job_starts = starts
+
+def _render_document(job):
+	"""
+	Parses and renders one document for the batch renderer.  Returns the
+	job's index, the document's path, the error message (None on success)
+	and the time taken.
+	"""
+	
+	index, path, outfile, formats = job
+	started = time.time()
+	_job_starts[index] = started
+	_job_pids[index] = os.getpid()
+	try:
+		try:
+			chart = ChartFactory().parse(path)
+			chart.render_formats(formats, outfile, parallel=False)
+		except Exception, e:
+			return (index, path, "%s: %s" % (e.__class__.__name__, e), time.time() - started)
+		return (index, path, None, time.time() - started)
+	finally:
+		_job_pids[index] = -1
+
+def _is_alive(pid):
+	"""Tells whether a process is still running."""
+	
+	try:
+		os.kill(pid, 0)
+	except OSError:
+		return False
+	return True
+
+class Checkpoint(object):
+	"""
+	Records which documents a batch run has rendered, so an interrupted run
+	can resume where it stopped.  Each line of the checkpoint file holds
+	the stamp (see _document_stamp) and path of one rendered document.
+	"""
+	
+	def __init__(self, path):
+		self.path = path
+		self.done = {}
+		if os.path.exists(path):
+			f = open(path)
+			try:
+				for line in f:
+					try:
+						digest, document = line.rstrip('\n').split('\t', 1)
+					except ValueError:
+						### A run killed mid-write can leave a partial line.
+						continue
+					self.done[document] = digest
+			finally:
+				f.close()
+		self.file = open(path, 'a')
+		
+	def is_done(self, document, stamp):
+		return self.done.get(document) == stamp
+		
+	def record(self, document, stamp):
+		self.done[document] = stamp
+		self.file.write("%s\t%s\n" % (stamp, document))
+		self.file.flush()
+		
+	def close(self):
+		self.file.close()
+
+def main(argv=None):
+	"""Command line entry point for batch rendering Chartshare documents."""
+	
+	parser = OptionParser(usage="%prog [options] FILE|DIRECTORY|GLOB ...",
+		description="Parses and renders Chartshare XML documents in parallel.")
+	parser.add_option('-f', '--format', action='append', dest='formats',
+		help="output format: pdf, eps, png or jpg (repeatable, default pdf)")
+	parser.add_option('-o', '--output-dir', dest='output_dir',
+		help="directory for rendered charts (default: next to each document)")
+	parser.add_option('-j', '--jobs', type='int', dest='jobs', default=multiprocessing.cpu_count(),
+		help="number of worker processes (default: %default)")
+	parser.add_option('-c', '--checkpoint', dest='checkpoint', default='.chartshare-checkpoint',
+		help="file recording finished documents (default: %default)")
+	parser.add_option('--check', dest='check', choices=['mtime', 'hash'], default='mtime',
+		help="skip documents rendered by an earlier run that are unchanged since, "
+			 "judged by modification time (mtime) or contents (hash) (default: %default)")
+	parser.add_option('--force', action='store_true', dest='force', default=False,
+		help="render every document, even if it is up to date")
+	parser.add_option('-t', '--timeout', type='float', dest='timeout',
+		help="seconds a document may take before its worker is killed (default: no limit)")
+	options, args = parser.parse_args(argv)
+	
+	if not args:
+		parser.error("no documents given")
+	formats = options.formats or ['pdf']
+	for i in formats:
+		if (i not in RReplayer.formats):
+			parser.error("unknown format: %s" % i)
+	checkpoint = Checkpoint(options.checkpoint)
+	jobs = []
+	stamps = {}
+	owners = {}
+	skipped = 0
+	failures = []
+	for path, name in find_documents(args):
+		if (options.output_dir):
+			outfile = os.path.join(options.output_dir, _document_base(name))
+		else:
+			outfile = _document_base(path)
+		outputs = ["%s.%s" % (outfile, i) for i in formats]
+		
+		key = os.path.normcase(os.path.abspath(outfile))
+		if (key in owners):
+			error = "output %s is also written by %s" % (outfile, owners[key])
+			failures.append((path, error))
+			print >> sys.stderr, "FAILED %s: %s" % (path, error)
+			continue
+		owners[key] = path
+		
+		try:
+			stamps[path] = _document_stamp(path, options.check)
+		except (IOError, OSError), e:
+			failures.append((path, "%s: %s" % (e.__class__.__name__, e)))
+			print >> sys.stderr, "FAILED %s: %s: %s" % (path, e.__class__.__name__, e)
+			continue
+		
+		if not options.force:
+			### Outputs of a document missing from the checkpoint may be
+			### partial files left by a killed run, so they never count.
+			fresh = checkpoint.is_done(os.path.abspath(path), stamps[path])
+			for i in outputs:
+				if not os.path.exists(i):
+					fresh = False
+				elif (options.check == 'mtime') and (os.path.getmtime(i) < os.path.getmtime(path)):
+					fresh = False
+			if fresh:
+				skipped += 1
+				continue
+		if (os.path.dirname(outfile) and not os.path.isdir(os.path.dirname(outfile))):
+			os.makedirs(os.path.dirname(outfile))
+		jobs.append((len(jobs), path, outfile, formats))
+	
+	rendered = 0
+	interrupted = False
+	started = time.time()
+	pids = multiprocessing.Array('i', len(jobs), lock=False)
+	starts = multiprocessing.Array('d', len(jobs), lock=False)
+	pool = multiprocessing.Pool(max(1, options.jobs), _init_worker, (pids, starts))
+	pending = set(range(len(jobs)))
+	lost = False
+	try:
+		try:
+			results = pool.imap_unordered(_render_document, jobs)
+			while pending:
+				### Waiting with a timeout lets an interrupt reach this process,
+				### and lets it notice jobs whose worker died or overran.
+				try:
+					index, path, error, elapsed = results.next(1)
+				except multiprocessing.TimeoutError:
+					now = time.time()
+					for index in sorted(pending):
+						pid = pids[index]
+						if (pid <= 0):
+							continue
+						if not _is_alive(pid):
+							error = "worker process %i died" % pid
+						elif (options.timeout and now - starts[index] > options.timeout):
+							os.kill(pid, signal.SIGKILL)
+							error = "timed out after %.1fs" % (now - starts[index])
+						else:
+							continue
+						### The pool never returns a lost job's result.
+						lost = True
+						pending.discard(index)
+						path = jobs[index][1]
+						failures.append((path, error))
+						print >> sys.stderr, "FAILED %s: %s" % (path, error)
+					continue
+				if index not in pending:
+					continue
+				pending.discard(index)
+				if (error is None):
+					rendered += 1
+					checkpoint.record(os.path.abspath(path), stamps[path])
+				else:
+					failures.append((path, error))
+					print >> sys.stderr, "FAILED %s: %s" % (path, error)
+			if lost:
+				### A pool with lost jobs never finishes closing.
+				pool.terminate()
+			else:
+				pool.close()
+		except KeyboardInterrupt:
+			interrupted = True
+			pool.terminate()
+		except:
+			pool.terminate()
+			raise
+	finally:
+		pool.join()
+		checkpoint.close()
+	elapsed = time.time() - started
+	
+	print "Rendered %i, skipped %i, failed %i in %.1fs (%.2f documents/s)." % (
+		rendered, skipped, len(failures), elapsed, (rendered + len(failures)) / max(elapsed, 0.001))
+	if interrupted:
+		print "Interrupted; run again to resume."
+	if failures:
+		print "Failures:"
+		for path, error in failures:
+			print "  %s: %s" % (path, error)
+	if interrupted:
+		return 130
+	elif failures:
+		return 1
+	return 0
+
 class SymbolOutOfRange(Exception):
     """Symbol out of Range."""
     
@@ -828,3 +2146,18 @@ class OffsetTypeError(Exception):
 		
 class ObjectOutOfContext(Exception):
 	"""Object must be contained within another object."""
+
+class RenderError(Exception):
+	"""A chart could not be rendered."""
+
+class ExportError(Exception):
+	"""Vector elements outside the vector's offsets or that are not numbers cannot be exported."""
+
+class InvalidObservation(Exception):
+	"""An observation must have a number count and a positive counting time."""
+
+class UnsupportedCompression(Exception):
+	"""The document's compression is unknown or its module is not installed."""
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,63 @@
+import bz2, gzip, os, shutil, tempfile, StringIO, unittest
+
+import Chartshare
+
+def _gzip(data):
+	buffer = StringIO.StringIO()
+	f = gzip.GzipFile(fileobj=buffer, mode='wb')
+	f.write(data)
+	f.close()
+	return buffer.getvalue()
+
+class DecompressingReaderTest(unittest.TestCase):
+	"""Reading compressed documents must not hold them in memory whole."""
+
+	### About 9MB that compresses to 27KB with gzip and 2KB with bz2.
+	document = '<observation date="2010-01-01" count="12" />\n' * 200000
+
+	def read_peak(self, data):
+		"""Reads data back 100 bytes at a time; returns it and the largest buffer."""
+		reader = Chartshare.open_document(StringIO.StringIO(data))
+		pieces = []
+		peak = 0
+		while True:
+			piece = reader.read(100)
+			if not piece:
+				break
+			pieces.append(piece)
+			peak = max(peak, len(reader.buffer))
+		return ''.join(pieces), peak
+
+	def test_gzip_peak(self):
+		data, peak = self.read_peak(_gzip(self.document))
+		self.assertEqual(data, self.document)
+		self.assertTrue(peak <= Chartshare._DecompressingReader.chunksize, peak)
+
+	def test_bz2_peak(self):
+		data, peak = self.read_peak(bz2.compress(self.document))
+		self.assertEqual(data, self.document)
+		### One 900KB bz2 block at a time.
+		self.assertTrue(peak <= 1000000, peak)
+
+	def test_concatenated_streams(self):
+		half = len(self.document) / 2
+		for data in (_gzip(self.document[:half]) + _gzip(self.document[half:]),
+				bz2.compress(self.document[:half]) + bz2.compress(self.document[half:])):
+			self.assertEqual(self.read_peak(data)[0], self.document)
+
+class OpenDocumentTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_unsupported_compression_leaves_no_file(self):
+		path = os.path.join(self.directory, 'chart.xml')
+		self.assertRaises(Chartshare.UnsupportedCompression,
+			Chartshare.open_document, path, 'wb', 'unknown')
+		self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+	unittest.main()